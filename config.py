@@ -3,6 +3,7 @@
 负责从 .env 文件读取环境变量，提供统一的配置访问接口
 """
 import os
+import re
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -10,58 +11,119 @@ from dotenv import load_dotenv
 # 获取当前脚本所在目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 加载 .env 文件
-load_dotenv(os.path.join(BASE_DIR, '.env'))
-
 logger = logging.getLogger(__name__)
 
+# 日期快速解析：YYYY-MM-DD / YYYY/MM/DD，可选 HH:MM:SS
+_DATE_RE = re.compile(r'^(\d{4})([-/])(\d{2})\2(\d{2})(?: (\d{2}):(\d{2}):(\d{2}))?$')
+
+# 环境变量快照：首次创建 Config 时才加载 .env，之后所有读取都走本地字典
+_ENV = {}
+_ENV_LOADED = False
+
+
+def _load_env(force: bool = False) -> dict:
+    """
+    加载 .env 文件并对环境变量做快照
+    
+    Args:
+        force: 是否强制重新加载（默认只加载一次）
+        
+    Returns:
+        dict: 环境变量快照
+    """
+    global _ENV, _ENV_LOADED
+    if force or not _ENV_LOADED:
+        load_dotenv(os.path.join(BASE_DIR, '.env'))
+        _ENV = dict(os.environ)
+        _ENV_LOADED = True
+    return _ENV
+
 
 class Config:
     """配置类，封装所有环境变量"""
     
     def __init__(self):
         """初始化配置，从环境变量中读取所有必要配置项"""
-        self._app_id = os.getenv('APPID')
-        self._app_secret = os.getenv('AppSecret')
-        self._account_id = os.getenv('ACCOUNT_ID')
+        env = _load_env()
+        
+        self._app_id = env.get('APPID')
+        self._app_secret = env.get('AppSecret')
+        self._account_id = env.get('ACCOUNT_ID')
         
         # 数据库配置
-        self._db_url = os.getenv('DB_URL')
+        self._db_url = env.get('DB_URL')
         
         # API 配置
-        self._api_base_url = os.getenv('API_BASE_URL', 'https://open.douyin.com')
+        self._api_base_url = env.get('API_BASE_URL', 'https://open.douyin.com')
         
         # 任务配置
-        self._task_id = os.getenv('TASK_ID', 'douyin_order_sync')
-        self._sync_interval = int(os.getenv('SYNC_INTERVAL', '3600'))
+        self._task_id = env.get('TASK_ID', 'douyin_order_sync')
+        self._sync_interval = int(env.get('SYNC_INTERVAL', '3600'))
         
         # 订单查询参数配置
         # 时间范围配置（天）
-        self._sync_days = int(os.getenv('SYNC_DAYS', '1'))
+        self._sync_days = int(env.get('SYNC_DAYS', '1'))
         
         # 自定义时间范围（可选）
         # 方式1：使用自然日期格式（推荐）
         # 格式：YYYY-MM-DD HH:MM:SS，例如：2024-01-01 00:00:00
-        self._start_date_str = os.getenv('START_DATE')
-        self._end_date_str = os.getenv('END_DATE')
+        self._start_date_str = env.get('START_DATE')
+        self._end_date_str = env.get('END_DATE')
         
         # 方式2：使用时间戳（向后兼容）
         # 如果配置了 START_TIME，则使用它作为开始时间（秒时间戳）
         # 如果配置了 END_TIME，则使用它作为结束时间（秒时间戳）
-        self._start_time_str = os.getenv('START_TIME')
-        self._end_time_str = os.getenv('END_TIME')
+        self._start_time_str = env.get('START_TIME')
+        self._end_time_str = env.get('END_TIME')
         
         # 订单状态筛选（可选）
-        self._order_status = os.getenv('ORDER_STATUS')
+        self._order_status = env.get('ORDER_STATUS')
         
         # 每页数量
-        self._page_size = int(os.getenv('PAGE_SIZE', '50'))
+        self._page_size = int(env.get('PAGE_SIZE', '50'))
         
         # 是否查询配送信息
-        self._get_secret_number = os.getenv('GET_SECRET_NUMBER', 'false').lower() == 'true'
+        self._get_secret_number = env.get('GET_SECRET_NUMBER', 'false').lower() == 'true'
         
         # 是否使用创单时间而非修改时间
-        self._use_create_time = os.getenv('USE_CREATE_TIME', 'false').lower() == 'true'
+        self._use_create_time = env.get('USE_CREATE_TIME', 'false').lower() == 'true'
+        
+        # 并发拉取的天数（线程数）
+        self._fetch_workers = int(env.get('FETCH_WORKERS', '1'))
+        
+        # 是否按每天已入库的最大修改时间做增量拉取（仅按修改时间拉取时生效）
+        self._incremental_sync = env.get('INCREMENTAL_SYNC', 'false').lower() == 'true'
+        
+        # Excel 导入时 raw_excel 是否保存整行原始数据（默认只保存未映射到字段的列）
+        self._excel_keep_raw = env.get('EXCEL_KEEP_RAW', 'false').lower() == 'true'
+        
+        # 并行解析Excel的进程数（默认顺序导入）
+        self._excel_parse_workers = int(env.get('EXCEL_PARSE_WORKERS', '1'))
+        
+        # 订单是否通过 COPY 流式写入（不在内存中缓存全部订单）
+        self._bulk_copy = env.get('BULK_COPY', 'false').lower() == 'true'
+        
+        # 数据库语句超时、事务内空闲超时（秒），0 表示不限制
+        self._db_statement_timeout = int(env.get('DB_STATEMENT_TIMEOUT', '300'))
+        self._db_idle_tx_timeout = int(env.get('DB_IDLE_TX_TIMEOUT', '600'))
+        
+        # 日志级别（DEBUG/INFO/WARNING/ERROR），无法识别时使用 INFO
+        log_level = env.get('LOG_LEVEL', 'INFO').upper()
+        self._log_level = log_level if isinstance(logging.getLevelName(log_level), int) else 'INFO'
+        
+        # 时间范围在进程生命周期内不会变化，启动时解析一次并缓存
+        # 配置错误时在此处直接抛出 ValueError，尽早失败
+        self._start_time = self._resolve_start_time()
+        self._end_time = self._resolve_end_time()
+    
+    @staticmethod
+    def reload_env():
+        """
+        重新加载 .env 文件并刷新环境变量快照
+        
+        主要用于测试或运行期修改环境变量后重新构造 Config
+        """
+        _load_env(force=True)
     
     @property
     def app_id(self) -> str:
@@ -186,6 +248,86 @@ class Config:
         """
         return self._use_create_time
     
+    @property
+    def fetch_workers(self) -> int:
+        """
+        获取并发拉取的天数（线程数）
+        
+        Returns:
+            int: 线程数（1-16），1 表示按天顺序拉取
+        """
+        return max(1, min(16, self._fetch_workers))
+    
+    @property
+    def incremental_sync(self) -> bool:
+        """
+        是否启用增量同步（跳过每天已入库的修改时间之前的部分）
+        
+        Returns:
+            bool: True 启用增量同步；使用创单时间拉取时无效
+        """
+        return self._incremental_sync and not self._use_create_time
+    
+    @property
+    def excel_keep_raw(self) -> bool:
+        """
+        Excel 导入时 raw_excel 是否保存整行原始数据
+        
+        Returns:
+            bool: True 保存整行，False 只保存未映射到字段的列
+        """
+        return self._excel_keep_raw
+    
+    @property
+    def excel_parse_workers(self) -> int:
+        """
+        获取并行解析Excel的进程数
+        
+        Returns:
+            int: 进程数（1-16），1 表示顺序导入
+        """
+        return max(1, min(16, self._excel_parse_workers))
+    
+    @property
+    def bulk_copy(self) -> bool:
+        """
+        是否通过 COPY 流式写入订单
+        
+        Returns:
+            bool: True 边拉取边 COPY 到临时表再合并，False 拉取完成后批量 Upsert
+        """
+        return self._bulk_copy
+    
+    @property
+    def db_statement_timeout(self) -> int:
+        """
+        数据库单条语句超时
+        
+        Returns:
+            int: 超时秒数，0 表示不限制
+        """
+        return max(0, self._db_statement_timeout)
+    
+    @property
+    def db_idle_tx_timeout(self) -> int:
+        """
+        数据库事务内空闲超时（流式写库时拉取下一页期间事务处于空闲状态，不宜过短）
+        
+        Returns:
+            int: 超时秒数，0 表示不限制
+        """
+        return max(0, self._db_idle_tx_timeout)
+    
+    @property
+    def log_level(self) -> str:
+        """
+        日志级别
+        
+        Returns:
+            str: 日志级别名称（如 'INFO'、'WARNING'）
+        """
+        return self._log_level
+    
     def _parse_date(self, date_str: str) -> datetime:
         """
         解析日期字符串，支持多种格式
@@ -199,7 +341,19 @@ class Config:
         Raises:
             ValueError: 日期格式错误
         """
-        # 尝试多种日期格式
+        # 快速路径：标准格式直接用正则拆分，避免逐个尝试 strptime
+        match = _DATE_RE.match(date_str)
+        if match:
+            year, _, month, day, hour, minute, second = match.groups()
+            try:
+                if hour is None:
+                    return datetime(int(year), int(month), int(day))
+                return datetime(int(year), int(month), int(day),
+                                int(hour), int(minute), int(second))
+            except ValueError:
+                pass
+        
+        # 兜底：尝试多种日期格式（如月、日不足两位的写法）
         date_formats = [
             '%Y-%m-%d %H:%M:%S',  # 2024-01-01 00:00:00
             '%Y-%m-%d',           # 2024-01-01
@@ -216,10 +370,9 @@ class Config:
         # 所有格式都失败
         raise ValueError(f"无法解析日期: {date_str}，支持的格式: YYYY-MM-DD, YYYY-MM-DD HH:MM:SS")
     
-    @property
-    def start_time(self) -> int:
+    def _resolve_start_time(self) -> int:
         """
-        获取开始时间戳（秒）
+        解析开始时间戳（秒）
         
         优先使用日期格式，其次使用时间戳
         
@@ -247,10 +400,9 @@ class Config:
         
         return None
     
-    @property
-    def end_time(self) -> int:
+    def _resolve_end_time(self) -> int:
         """
-        获取结束时间戳（秒）
+        解析结束时间戳（秒）
         
         优先使用日期格式，其次使用时间戳
         
@@ -278,6 +430,26 @@ class Config:
         
         return None
     
+    @property
+    def start_time(self) -> int:
+        """
+        获取开始时间戳（秒）
+        
+        Returns:
+            int: 开始时间戳，未配置则返回 None
+        """
+        return self._start_time
+    
+    @property
+    def end_time(self) -> int:
+        """
+        获取结束时间戳（秒）
+        
+        Returns:
+            int: 结束时间戳，未配置则返回 None
+        """
+        return self._end_time
+    
     def validate(self) -> bool:
         """
         验证所有必要的配置项是否完整
@@ -293,5 +465,27 @@ class Config:
         return all(field is not None for field in required_fields)
 
 
-# 全局配置实例
-config = Config()
+# 全局配置实例（延迟到首次访问时创建）
+_instance = None
+
+
+def get_config() -> Config:
+    """
+    获取全局配置实例
+    
+    首次调用时才创建 Config，只导入模块常量的脚本无需解析全部配置
+    
+    Returns:
+        Config: 全局配置实例
+    """
+    global _instance
+    if _instance is None:
+        _instance = Config()
+    return _instance
+
+
+def __getattr__(name: str):
+    """兼容旧写法 `from config import config`，访问时才创建实例"""
+    if name == 'config':
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
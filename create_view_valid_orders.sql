@@ -7,8 +7,21 @@
 -- 1. 关联orders_excel表：数值字段求和，字符串字段去重合并（逗号分隔）
 -- 2. 关联travel_bookings表：获取出行日期
 -- 3. 按order_id分组：每个订单一条记录
+--
+-- 物化视图：查询直接读取预先计算好的结果，不再每次重新关联聚合；
+-- 同步程序写入新订单后执行 REFRESH MATERIALIZED VIEW CONCURRENTLY valid_orders 刷新
+-- （CONCURRENTLY 刷新依赖下方的唯一索引，刷新期间不阻塞读取）
+
+-- 删除旧的普通视图或物化视图（两者的 DROP 语句不通用，先按类型判断）
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views WHERE viewname = 'valid_orders' AND schemaname = current_schema()) THEN
+        EXECUTE 'DROP VIEW valid_orders';
+    END IF;
+END $$;
+DROP MATERIALIZED VIEW IF EXISTS valid_orders;
 
-CREATE OR REPLACE VIEW valid_orders AS
+CREATE MATERIALIZED VIEW valid_orders AS
 SELECT 
     -- ========== orders表字段 ==========
     o.order_id,
@@ -39,7 +52,11 @@ SELECT
     STRING_AGG(DISTINCT oe.owner_uid, ',') as owner_uid,
     
     -- ========== travel_bookings表字段 ==========
-    tb.travel_date
+    tb.travel_date,
+    
+    -- 唯一索引键：没有预约的订单 travel_date 为 NULL，NULL 在 CONCURRENTLY 刷新比对时互不相等，
+    -- 会导致这些行每次刷新都被删除重插；用 -infinity 代替 NULL 作为非空键，不与真实日期冲突
+    COALESCE(tb.travel_date, '-infinity'::date) as travel_date_key
 
 FROM orders o
 
@@ -51,7 +68,14 @@ WHERE (o.source_order_id IS NULL OR o.source_order_id = '')
 
 GROUP BY o.order_id, o.count, o.pay_time, o.order_status, o.sku_id, o.sku_name, tb.travel_date
 
-ORDER BY o.pay_time DESC;
+WITH DATA;
+
+-- 唯一索引：每个订单的每个出行日期一条记录，REFRESH ... CONCURRENTLY 必需
+-- 建在非空的 travel_date_key 上，未变化的无预约订单在刷新时不会被重写
+CREATE UNIQUE INDEX valid_orders_order_travel_uidx ON valid_orders (order_id, travel_date_key);
+
+-- 按支付时间倒序查询（替代原视图中的 ORDER BY）
+CREATE INDEX valid_orders_pay_time_idx ON valid_orders (pay_time DESC);
 
 -- 添加视图注释
-COMMENT ON VIEW valid_orders IS '有效订单视图：关联orders、orders_excel、travel_bookings三个表，数值字段求和，字符串字段去重合并（逗号分隔）';
+COMMENT ON MATERIALIZED VIEW valid_orders IS '有效订单物化视图：关联orders、orders_excel、travel_bookings三个表，数值字段求和，字符串字段去重合并（逗号分隔）';
@@ -0,0 +1,37 @@
+"""
+数据库连接工具模块
+供 execute_views.py、verify_views.py 等独立脚本共用（主程序通过 DatabaseManager 的连接池访问数据库）
+"""
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv('.env')
+
+# 数据库连接URL：进程内只读取一次；psycopg2（libpq）直接解析 postgresql:// URI
+DB_URL = os.getenv('DB_URL')
+
+
+# 脚本连接在 pg_stat_activity 中显示的应用名
+APPLICATION_NAME = 'douyin_views'
+
+
+def connect_database(db_url: str = None, autocommit: bool = True, statement_timeout: int = 0):
+    """
+    连接数据库
+    
+    Args:
+        db_url: 数据库连接URL（默认使用环境变量 DB_URL）
+        autocommit: 是否自动提交（False 时由调用方 commit / rollback）
+        statement_timeout: 单条语句超时（秒），0 表示不限制
+        
+    Returns:
+        psycopg2 连接对象
+    """
+    kwargs = {'application_name': APPLICATION_NAME}
+    if statement_timeout:
+        kwargs['options'] = f"-c statement_timeout={statement_timeout * 1000}"
+    conn = psycopg2.connect(db_url or DB_URL, **kwargs)
+    conn.autocommit = autocommit
+    return conn
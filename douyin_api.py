@@ -3,21 +3,100 @@
 包含解密、鉴权、分页拉取订单等核心 API 逻辑
 """
 import requests
-import json
-import base64
-from typing import Dict, Any, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import binascii
+from typing import Dict, Any, List, Optional, NamedTuple
 from datetime import datetime, timedelta
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.backends import default_backend
+import os
+import time
+import tempfile
 import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
+# 访问令牌的本地缓存文件：进程重启后可复用未过期的 token
+TOKEN_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.token_cache.json')
+
+# 按天切分时间范围的步长（秒）
+DAY_SECONDS = 86400
+
+# 订单查询的时间参数名：下标 0 为修改时间，下标 1 为创单时间（按 use_create_time 取值）
+_TIME_KEYS = (
+    ('update_order_start_time', 'update_order_end_time'),
+    ('create_order_start_time', 'create_order_end_time'),
+)
+
+
+# 分页循环中停止回调的最小检查间隔（秒）：回调可能查询数据库，不必每页都调用
+STOP_CHECK_INTERVAL = 2.0
+
+
+def _throttle_stop_check(check_stop_callback, interval: float = STOP_CHECK_INTERVAL):
+    """
+    包装停止回调：两次实际调用之间至少间隔 interval 秒，一旦返回 True 之后始终返回 True
+    
+    并发拉取时多个线程共用同一个包装回调，内部状态由锁保护
+    
+    Args:
+        check_stop_callback: 原始停止回调（可为 None）
+        interval: 最小检查间隔（秒）
+        
+    Returns:
+        包装后的回调；原始回调为 None 时返回 None
+    """
+    if check_stop_callback is None:
+        return None
+    
+    state = {'last_check': None, 'stopped': False}
+    lock = threading.Lock()
+    
+    def check():
+        with lock:
+            if state['stopped']:
+                return True
+            now = time.monotonic()
+            if state['last_check'] is not None and now - state['last_check'] < interval:
+                return False
+            state['last_check'] = now
+            state['stopped'] = bool(check_stop_callback())
+            return state['stopped']
+    
+    return check
+
+
+class PageResult(NamedTuple):
+    """单页订单查询结果"""
+    orders: list        # 本页订单列表
+    has_more: bool      # 是否还有下一页
+    next_cursor: str    # 下一页游标（无下一页时为当前游标）
+    total_count: int    # 订单总数
+
+
+@functools.lru_cache(maxsize=4)
+def _aesgcm_for(key_b64: str) -> AESGCM:
+    """
+    按密钥缓存 AESGCM 实例，避免每次解密都重新解码密钥并初始化
+    
+    Args:
+        key_b64: 解密密钥（Base64 编码）
+        
+    Returns:
+        AESGCM: 可复用的 AESGCM 实例
+    """
+    return AESGCM(binascii.a2b_base64(key_b64))
+
 
 class DouyinAPI:
     """抖音 API 客户端，处理所有与抖音平台的交互"""
     
-    def __init__(self, app_id: str, app_secret: str, base_url: str, account_id: str = None):
+    def __init__(self, app_id: str, app_secret: str, base_url: str, account_id: str = None,
+                 token_cache_file: Optional[str] = TOKEN_CACHE_FILE):
         """
         初始化抖音 API 客户端
         
@@ -26,6 +105,7 @@ class DouyinAPI:
             app_secret: 抖音应用 App Secret
             base_url: API 基础 URL
             account_id: 抖音账号 ID（可选）
+            token_cache_file: token 缓存文件路径（可选，传 None 关闭磁盘缓存）
         """
         self.app_id = app_id
         self.app_secret = app_secret
@@ -33,6 +113,32 @@ class DouyinAPI:
         self.account_id = account_id
         self._access_token = None
         self._token_expire_time = None
+        self._token_lock = threading.Lock()
+        
+        # 从磁盘恢复上次获取的 token（未过期才会被使用）
+        self._token_cache_file = token_cache_file
+        self._load_token_cache()
+        
+        # 每次查询都相同的请求参数
+        self._base_params = {'account_id': self.account_id}
+        
+        # 复用同一个 Session：保持 HTTP keep-alive，分页拉取时不必每次重新握手
+        # 对网关临时错误（429/5xx）做有限次数的退避重试
+        self._session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+    
+    def close(self):
+        """关闭 HTTP 会话，释放连接池"""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
     def decrypt(self, encrypted_data: str, iv: str, key: str) -> str:
         """
@@ -47,13 +153,13 @@ class DouyinAPI:
             str: 解密后的数据（JSON 字符串）
         """
         try:
-            # Base64 解码
-            encrypted_bytes = base64.b64decode(encrypted_data)
-            iv_bytes = base64.b64decode(iv)
-            key_bytes = base64.b64decode(key)
+            # Base64 解码（密钥对应的 AESGCM 实例已缓存）
+            # a2b_base64 直接接受 ASCII 字符串，省去 b64decode 的额外包装与校验
+            encrypted_bytes = binascii.a2b_base64(encrypted_data)
+            iv_bytes = binascii.a2b_base64(iv)
             
             # AES-GCM 解密
-            aesgcm = AESGCM(key_bytes)
+            aesgcm = _aesgcm_for(key)
             decrypted_bytes = aesgcm.decrypt(iv_bytes, encrypted_bytes, None)
             
             # 转换为字符串
@@ -70,10 +176,33 @@ class DouyinAPI:
             str: 访问令牌
         """
         # 检查 token 是否过期（提前 5 分钟刷新）
-        if self._access_token and self._token_expire_time:
-            if datetime.now() < self._token_expire_time - timedelta(minutes=5):
+        if self._token_is_valid():
+            return self._access_token
+        
+        # 多线程并发拉取时只允许一个线程刷新 token，其余线程等待后直接复用
+        with self._token_lock:
+            if self._token_is_valid():
                 return self._access_token
+            return self._refresh_token()
+    
+    def _token_is_valid(self) -> bool:
+        """
+        判断当前 token 是否仍然有效（提前 5 分钟视为过期）
         
+        Returns:
+            bool: token 有效返回 True
+        """
+        if self._access_token and self._token_expire_time:
+            return datetime.now() < self._token_expire_time - timedelta(minutes=5)
+        return False
+    
+    def _refresh_token(self) -> str:
+        """
+        向抖音 OAuth 接口请求新的访问令牌
+        
+        Returns:
+            str: 访问令牌
+        """
         # 获取新 token
         # 【关键点1】URL 必须是完整的抖音 OAuth 地址
         url = "https://open.douyin.com/oauth/client_token/"
@@ -90,10 +219,10 @@ class DouyinAPI:
         
         logger.debug(f"发送 Token 请求到: {url}")
         
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = self._session.post(url, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # 检查响应状态
         if data.get('code', 0) != 0:
@@ -108,12 +237,83 @@ class DouyinAPI:
         self._token_expire_time = datetime.now() + timedelta(seconds=expires_in)
         
         logger.info("成功获取访问令牌")
+        self._save_token_cache()
         return self._access_token
     
+    def _load_token_cache(self):
+        """
+        从缓存文件加载 token
+        
+        缓存属于其他 app_id 或已过期时忽略；读取失败不影响正常获取 token
+        """
+        if not self._token_cache_file:
+            return
+        
+        try:
+            with open(self._token_cache_file, 'rb') as f:
+                cache = orjson.loads(f.read())
+            
+            # 内容格式不对（非字典、expires_at 非数字等）同样视为缓存损坏
+            if not isinstance(cache, dict):
+                raise ValueError(f"缓存内容不是对象: {type(cache).__name__}")
+            if cache.get('app_id') != self.app_id or not cache.get('access_token'):
+                return
+            
+            access_token = cache['access_token']
+            expire_time = datetime.fromtimestamp(cache.get('expires_at', 0))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"读取 token 缓存失败，将重新获取: {e}")
+            return
+        
+        self._access_token = access_token
+        self._token_expire_time = expire_time
+        if self._token_is_valid():
+            logger.info("已从缓存文件恢复访问令牌")
+        else:
+            self._access_token = None
+            self._token_expire_time = None
+    
+    def _save_token_cache(self):
+        """
+        将当前 token 写入缓存文件
+        
+        先写临时文件再 os.replace 原子替换，多个进程同时刷新时
+        读到的始终是某一次完整写入的内容；文件权限为 600
+        """
+        if not self._token_cache_file:
+            return
+        
+        cache = {
+            'app_id': self.app_id,
+            'access_token': self._access_token,
+            'expires_at': int(self._token_expire_time.timestamp())
+        }
+        
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix='.token_cache.', dir=os.path.dirname(self._token_cache_file) or '.'
+            )
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(cache))
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._token_cache_file)
+            tmp_path = None
+        except Exception as e:
+            logger.warning(f"写入 token 缓存失败: {e}")
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
     def fetch_orders(self, start_time: int, end_time: int, 
                     cursor: str = "0", page_size: int = 20,
                     order_status: int = None, get_secret_number: bool = False,
-                    use_create_time: bool = False) -> Dict[str, Any]:
+                    use_create_time: bool = False) -> PageResult:
         """
         拉取订单数据（分页）
         
@@ -127,7 +327,7 @@ class DouyinAPI:
             use_create_time: 是否使用创单时间而非修改时间（默认 False）
             
         Returns:
-            Dict[str, Any]: 包含订单列表、下一页游标和是否有更多数据的响应数据
+            PageResult: 包含订单列表、下一页游标和是否有更多数据的响应数据
         """
         # 验证 account_id
         if not self.account_id:
@@ -138,20 +338,17 @@ class DouyinAPI:
         
         # 构建请求参数
         url = f"{self.base_url}/goodlife/v1/trade/order/query/"
-        params = {
-            'access_token': access_token,
-            'account_id': self.account_id,
-            'cursor': cursor,          
-            'page_size': page_size
-        }
         
         # 根据配置选择使用创单时间还是修改时间
-        if use_create_time:
-            params['create_order_start_time'] = start_time
-            params['create_order_end_time'] = end_time
-        else:
-            params['update_order_start_time'] = start_time
-            params['update_order_end_time'] = end_time
+        start_key, end_key = _TIME_KEYS[bool(use_create_time)]
+        params = self._base_params.copy()
+        params.update({
+            'access_token': access_token,
+            'cursor': cursor,
+            'page_size': page_size,
+            start_key: start_time,
+            end_key: end_time
+        })
         
         # 可选参数
         if order_status is not None:
@@ -162,13 +359,13 @@ class DouyinAPI:
         
         logger.info(f"拉取订单: start={start_time}, end={end_time}, cursor={cursor}")
         
-        response = requests.get(url, params=params, timeout=30)
+        response = self._session.get(url, params=params, timeout=30)
         
         # === 调试日志 (保留以便出错时查看) ===
         # logger.debug(f"请求URL: {response.url}")
         
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # 检查响应状态
         if data.get('code', 0) != 0:
@@ -176,17 +373,15 @@ class DouyinAPI:
             raise ValueError(f"API 错误: {error_msg}")
         
         # 提取数据
-        result = {
-            'orders': [],
-            'has_more': False,
-            'next_cursor': cursor, # 默认保持当前cursor
-            'total_count': 0
-        }
+        orders = []
+        has_more = False
+        next_cursor = cursor  # 默认保持当前cursor
+        total_count = 0
         
         if 'data' in data and data['data']:
             orders_data = data['data']
-            result['orders'] = orders_data.get('orders', [])
-            result['total_count'] = orders_data.get('total_count', 0)
+            orders = orders_data.get('orders', [])
+            total_count = orders_data.get('total_count', 0)
             
             # === 【核心修正】解析 search_after ===
             # CursorValue 藏在 search_after 字段里，而不是直接在 data 里
@@ -197,26 +392,130 @@ class DouyinAPI:
             # 注意：某些情况下 orders 为空但有 cursor，也需要继续翻页
             if cursor_value_list:
                 # 将数组拼接成字符串: ["123", "456"] -> "123,456"
-                next_cursor = ','.join(str(x) for x in cursor_value_list)
-                result['next_cursor'] = next_cursor
-                result['has_more'] = True 
-            else:
-                result['has_more'] = False
-        
-        logger.info(f"拉取结果: 本页{len(result['orders'])}条, has_more={result['has_more']}")
-        return result
+                next_cursor = ','.join(map(str, cursor_value_list))
+                # 服务端偶尔会原样返回当前游标，继续翻页只会重复拉同一页
+                has_more = next_cursor != cursor
+        
+        logger.info(f"拉取结果: 本页{len(orders)}条, has_more={has_more}")
+        return PageResult(orders, has_more, next_cursor, total_count)
 
+    def _iter_day_pages(self, day_label, start_ts: int, end_ts: int,
+                        page_size: int = 50, order_status: int = None,
+                        get_secret_number: bool = False, use_create_time: bool = False,
+                        check_stop_callback=None, prefetch: bool = False):
+        """
+        [生成器] 逐页拉取一天内的订单，每拉到一页就交出一页
+        
+        Args:
+            day_label: 日期标签（仅用于日志）
+            start_ts: 当天开始时间戳（秒）
+            end_ts: 当天结束时间戳（秒）
+            page_size: 每页数量
+            order_status: 订单状态筛选（可选）
+            get_secret_number: 是否查询配送信息（可选）
+            use_create_time: 是否使用创单时间而非修改时间（可选）
+            check_stop_callback: 检查是否应该停止的回调函数（可选）
+            prefetch: 是否在消费方处理当前页时后台预取下一页（可选）
+            
+        Yields:
+            List[Dict[str, Any]]: 单页订单列表（空页不交出）
+        """
+        logger.info(f"=== [生成器] 开始处理: {day_label} ===")
+        
+        # 当天累计条数（仅用于日志，不再在内存中攒整天的数据）
+        day_count = 0
+        
+        fetch_page = functools.partial(
+            self.fetch_orders,
+            start_ts, end_ts,
+            page_size=page_size,
+            order_status=order_status,
+            get_secret_number=get_secret_number,
+            use_create_time=use_create_time
+        )
+        
+        # 下一页的游标要等本页解析完才知道，无法整体并发；
+        # 但可以在 main.py 写库的同时用一个后台线程提前请求下一页
+        prefetcher = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        pending = None  # 预取中的下一页
+        
+        # --- 内层分页循环 ---
+        cursor = "0"
+        page_count = 0
+        max_pages = 200
+        
+        try:
+            while page_count < max_pages:
+                # 检查是否应该停止
+                if check_stop_callback and check_stop_callback():
+                    logger.info("检测到停止信号，终止分页拉取")
+                    break
+                
+                page_count += 1
+                try:
+                    result = pending.result() if pending else fetch_page(cursor=cursor)
+                except Exception as e:
+                    logger.error(f"拉取分页失败: {e}")
+                    break
+                pending = None
+                
+                orders = result.orders
+                finished = not result.has_more or result.next_cursor == cursor
+                if not finished:
+                    cursor = result.next_cursor
+                    # 先提交下一页请求，再把本页交给消费方
+                    if prefetcher and page_count < max_pages:
+                        pending = prefetcher.submit(fetch_page, cursor=cursor)
+                
+                if orders:
+                    day_count += len(orders)
+                    yield orders
+                
+                if finished:
+                    break
+        finally:
+            if prefetcher:
+                # 提前停止时不等待预取请求返回
+                prefetcher.shutdown(wait=False, cancel_futures=True)
+        # ---------------------------
+        
+        logger.info(f"日期 {day_label} 完成，共 {day_count} 条")
+    
+    def _fetch_one_day(self, day_label, start_ts: int, end_ts: int, **kwargs) -> List[Dict[str, Any]]:
+        """
+        拉取一天内的所有分页订单（线程池并发拉取时使用）
+        
+        Args:
+            day_label: 日期标签（仅用于日志）
+            start_ts: 当天开始时间戳（秒）
+            end_ts: 当天结束时间戳（秒）
+            **kwargs: 透传给 _iter_day_pages 的拉取参数
+            
+        Returns:
+            List[Dict[str, Any]]: 当天的订单列表
+        """
+        day_orders = []
+        for orders in self._iter_day_pages(day_label, start_ts, end_ts, **kwargs):
+            day_orders.extend(orders)
+        return day_orders
+    
     def fetch_all_orders_by_day(self, start_time: datetime, end_time: datetime,
                                page_size: int = 50, order_status: int = None,
                                get_secret_number: bool = False, use_create_time: bool = False,
-                               check_stop_callback=None):
+                               check_stop_callback=None, max_workers: int = 1,
+                               min_update_ts_per_day: Optional[Dict[Any, int]] = None):
         """
         [生成器版] 按天切分拉取订单
         
         功能：
-        每次拉取完"一整天"的数据，就通过 yield 交给外部处理。
+        顺序拉取时每拉到"一页"数据，就通过 yield 交给外部处理。
         内存占用极低，哪怕拉取 10 年的数据也不会崩。
         
+        各天之间互不依赖，max_workers > 1 时使用线程池并发拉取多天，
+        此时每次交出一整天的数据，哪天先拉完就先交出哪天（不保证日期顺序）
+        
+        调用方只应假设每次交出的是"一批订单"，需要按天聚合时自行处理
+        
         Args:
             start_time: 开始时间
             end_time: 结束时间
@@ -225,73 +524,74 @@ class DouyinAPI:
             get_secret_number: 是否查询配送信息（可选）
             use_create_time: 是否使用创单时间而非修改时间（可选）
             check_stop_callback: 检查是否应该停止的回调函数（可选）
-                               如果返回 True，则停止拉取
+                               如果返回 True，则停止拉取（最多每 STOP_CHECK_INTERVAL 秒调用一次）
+            max_workers: 并发拉取的天数（默认 1，即顺序拉取）
+            min_update_ts_per_day: 每天已入库的最大修改时间戳 {date: ts}（可选）
+                               仅在按修改时间拉取时生效，当天从该时间点开始拉取，
+                               跳过已经同步过的部分
         """
-        current_day = start_time
+        # 分页循环中频繁检查停止信号，限制实际调用回调的频率
+        check_stop_callback = _throttle_stop_check(check_stop_callback)
         
-        while current_day <= end_time:
-            # 检查是否应该停止
-            if check_stop_callback and check_stop_callback():
-                logger.info("检测到停止信号，终止订单拉取")
-                break
-            
-            # 计算当天的结束时间
-            next_day = current_day + timedelta(days=1)
-            day_end = min(next_day, end_time)
-            
-            start_ts = int(current_day.timestamp())
-            end_ts = int(day_end.timestamp())
-            
-            logger.info(f"=== [生成器] 开始处理: {current_day.date()} ===")
-            
-            # 当天的数据容器
-            day_orders = [] 
-            
-            # --- 内层分页循环 ---
-            cursor = "0"
-            page_count = 0
-            max_pages = 200
-            
-            while page_count < max_pages:
+        # 预先切分出每天的时间范围（直接用整数秒计算，避免反复构造 datetime）
+        start_ts = int(start_time.timestamp())
+        end_ts = int(end_time.timestamp())
+        from_ts = datetime.fromtimestamp
+        day_ranges = [
+            (from_ts(day_start).date(), day_start, min(day_start + DAY_SECONDS, end_ts))
+            for day_start in range(start_ts, end_ts, DAY_SECONDS)
+        ]
+        
+        # 增量同步：按修改时间拉取时，每天从已入库的最大修改时间开始（含该秒，Upsert 会去重）
+        if min_update_ts_per_day and not use_create_time:
+            total_days = len(day_ranges)
+            day_ranges = [
+                (day_label, max(day_start, min_update_ts_per_day.get(day_label, 0)), day_end)
+                for day_label, day_start, day_end in day_ranges
+            ]
+            day_ranges = [r for r in day_ranges if r[1] < r[2]]
+            logger.info(f"增量同步: 共 {total_days} 天，需拉取 {len(day_ranges)} 天")
+        
+        fetch_kwargs = dict(
+            page_size=page_size,
+            order_status=order_status,
+            get_secret_number=get_secret_number,
+            use_create_time=use_create_time,
+            check_stop_callback=check_stop_callback
+        )
+        
+        if max_workers <= 1 or len(day_ranges) <= 1:
+            for day_label, start_ts, end_ts in day_ranges:
                 # 检查是否应该停止
                 if check_stop_callback and check_stop_callback():
-                    logger.info("检测到停止信号，终止分页拉取")
+                    logger.info("检测到停止信号，终止订单拉取")
                     break
                 
-                page_count += 1
-                try:
-                    result = self.fetch_orders(
-                        start_ts, end_ts, 
-                        cursor=cursor, 
-                        page_size=page_size,
-                        order_status=order_status,
-                        get_secret_number=get_secret_number,
-                        use_create_time=use_create_time
-                    )
-                    
-                    orders = result.get('orders', [])
-                    # 收集这一天的数据
-                    day_orders.extend(orders)
-                    
-                    has_more = result.get('has_more', False)
-                    next_cursor = result.get('next_cursor')
-                    
-                    if not has_more or next_cursor == cursor:
+                # 【核心修改】不攒整天的数据，每拉到一页就直接"交"出去
+                # <--- 这里暂停函数，把数据扔给 main.py，等 main.py 存完库再回来
+                yield from self._iter_day_pages(day_label, start_ts, end_ts,
+                                                prefetch=True, **fetch_kwargs)
+            return
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(self._fetch_one_day, day_label, start_ts, end_ts, **fetch_kwargs)
+                for day_label, start_ts, end_ts in day_ranges
+            ]
+            try:
+                for future in as_completed(futures):
+                    # 检查是否应该停止
+                    if check_stop_callback and check_stop_callback():
+                        logger.info("检测到停止信号，终止订单拉取")
                         break
-                    cursor = next_cursor
                     
-                except Exception as e:
-                    logger.error(f"拉取分页失败: {e}")
-                    break
-            # ---------------------------
-            
-            logger.info(f"日期 {current_day.date()} 完成，共 {len(day_orders)} 条，准备存库...")
-            
-            # 【核心修改】不要存 all_orders，直接把当天的货"交"出去
-            if day_orders:
-                yield day_orders  # <--- 这里暂停函数，把数据扔给 main.py，等 main.py 存完库再回来
-            
-            current_day = next_day
+                    day_orders = future.result()
+                    if day_orders:
+                        yield day_orders
+            finally:
+                # 停止或消费方提前结束时，取消尚未开始的任务
+                for future in futures:
+                    future.cancel()
     
     def _make_request(self, url: str, params: Dict[str, Any], 
                      headers: Dict[str, str]) -> Dict[str, Any]:
@@ -306,7 +606,7 @@ class DouyinAPI:
         Returns:
             Dict[str, Any]: 响应数据
         """
-        response = requests.get(url, params=params, headers=headers, timeout=30)
+        response = self._session.get(url, params=params, headers=headers, timeout=30)
         logger.debug(f"请求URL: {response.url}")
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
@@ -6,6 +6,7 @@ import os
 import time
 import signal
 import sys
+import threading
 import logging
 from datetime import datetime
 from config import config
@@ -13,9 +14,9 @@ from database import DatabaseManager
 from task_manager import TaskManager
 from excel_importer import ExcelImporter
 
-# 配置日志
+# 配置日志（日志级别由 LOG_LEVEL 环境变量控制）
 logging.basicConfig(
-    level=logging.INFO,
+    level=config.log_level,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -23,6 +24,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 处理的退出信号及其名称（预先计算，信号处理函数中只做字典查找）
+_SIG_NAMES = {int(s): s.name for s in (signal.SIGTERM, signal.SIGINT)}
+
+# data 目录无变化时跳过扫描，但至少每隔该秒数完整扫描一次（兜底重试失败文件）
+FULL_SCAN_INTERVAL = 60
+
 
 class ExcelImportLoop:
     """Excel导入循环程序"""
@@ -35,7 +42,13 @@ class ExcelImportLoop:
             sys.exit(1)
         
         # 初始化数据库管理器
-        self.db_manager = DatabaseManager(config.db_url, config.app_secret)
+        self.db_manager = DatabaseManager(
+            config.db_url,
+            config.app_secret,
+            application_name='douyin_excel_import',
+            statement_timeout=config.db_statement_timeout,
+            idle_in_transaction_timeout=config.db_idle_tx_timeout
+        )
         
         # 创建数据表（先创建表）
         self.db_manager.create_tables()
@@ -45,7 +58,11 @@ class ExcelImportLoop:
         self.db_manager.migrate_all_models()
         
         # 初始化Excel导入器
-        self.excel_importer = ExcelImporter(self.db_manager)
+        self.excel_importer = ExcelImporter(
+            self.db_manager,
+            keep_raw=config.excel_keep_raw,
+            parse_workers=config.excel_parse_workers
+        )
         
         # 初始化任务管理器
         self.task_manager = TaskManager(self.db_manager, 'excel_import')
@@ -53,6 +70,13 @@ class ExcelImportLoop:
         # 运行标志
         self._running = False
         
+        # 退出事件：信号到达时立即唤醒等待中的主循环
+        self._stop_event = threading.Event()
+        
+        # 上次扫描时 data 目录的修改时间与扫描时刻，用于跳过无变化的扫描
+        self._last_dir_mtime = None
+        self._last_scan_time = 0.0
+        
         # 设置信号处理器
         self.setup_signal_handlers()
     
@@ -64,9 +88,9 @@ class ExcelImportLoop:
     
     def signal_handler(self, signum, frame):
         """信号处理函数"""
-        signal_name = signal.Signals(signum).name
-        logger.info(f"收到信号 {signal_name} ({signum})，准备优雅退出...")
+        logger.info("收到信号 %s (%d)，准备优雅退出...", _SIG_NAMES.get(signum, signum), signum)
         self._running = False
+        self._stop_event.set()
     
     def run_once(self):
         """
@@ -78,9 +102,23 @@ class ExcelImportLoop:
         try:
             # 扫描data文件夹
             data_dir = 'data'
-            if not os.path.exists(data_dir):
+            try:
+                dir_mtime = os.stat(data_dir).st_mtime_ns
+            except FileNotFoundError:
                 os.makedirs(data_dir)
                 logger.info(f"创建data目录: {data_dir}")
+                dir_mtime = os.stat(data_dir).st_mtime_ns
+            
+            # 目录内新增/删除/改名文件都会更新目录的 mtime；
+            # 没有变化且未到兜底扫描时间时，直接跳过本轮扫描
+            now = time.monotonic()
+            if (dir_mtime == self._last_dir_mtime
+                    and now - self._last_scan_time < FULL_SCAN_INTERVAL):
+                return 0
+            
+            # 先记录再扫描：扫描过程中到达的文件会在下一轮被发现
+            self._last_dir_mtime = dir_mtime
+            self._last_scan_time = now
             
             # 导入Excel文件
             imported_count = self.excel_importer.scan_and_import(data_dir)
@@ -100,14 +138,10 @@ class ExcelImportLoop:
         """
         logger.info(f"进入待机模式，等待 {seconds} 秒...")
         
-        step = 1  # 每次睡 1 秒
-        for _ in range(0, seconds, step):
-            # 每秒醒来检查一次退出信号
-            if not self._running:
-                logger.info("检测到退出信号，终止等待，准备关闭...")
-                return
-            
-            time.sleep(step)
+        # Event.wait 在等待期间不占用 CPU，收到退出信号时立即返回
+        if self._stop_event.wait(timeout=seconds):
+            logger.info("检测到退出信号，终止等待，准备关闭...")
+            return
         
         logger.info("等待结束，准备进行下一轮导入")
     
@@ -119,6 +153,7 @@ class ExcelImportLoop:
         """
         logger.info("启动Excel导入程序")
         self._running = True
+        self._stop_event.clear()
         
         # 更新初始状态
         self.task_manager.set_task_status('RUNNING')
@@ -136,10 +171,16 @@ class ExcelImportLoop:
                     if imported_count > 0:
                         logger.info(f"✅ 导入完成: {imported_count} 条记录")
                         
+                        # 物化视图关联了 orders_excel / travel_bookings，导入后刷新
+                        try:
+                            self.db_manager.refresh_materialized_views()
+                        except Exception as e:
+                            logger.error(f"刷新物化视图失败: {e}", exc_info=True)
+                        
                         # 导入成功，更新状态
                         self.task_manager.set_task_status(
                             'RUNNING',
-                            last_sync_time=datetime.now().isoformat()
+                            last_sync_time=datetime.now()
                         )
                     else:
                         logger.info("没有新的Excel文件")
@@ -3,176 +3,456 @@ Excel数据导入模块
 负责读取、解析和导入Excel文件到数据库
 """
 import os
+import re
 import logging
-from datetime import datetime, date
+import functools
+from datetime import datetime, date, timedelta
+from operator import itemgetter
+from itertools import islice, repeat
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import openpyxl
-from typing import List, Dict, Any
+from openpyxl.xml import LXML
+from typing import List, Dict, Any, Tuple, Iterator, Iterable, Optional
+
+# 可选依赖：python-calamine（Rust 实现的 Excel 解析器，比 openpyxl 快一个数量级）
+# 未安装时回退到 openpyxl 只读模式
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
 
 logger = logging.getLogger(__name__)
 
+# 流式导入售卖明细时每批写库的记录数
+EXCEL_BATCH_SIZE = 5000
+
+# 连续遇到这么多空行即视为表格结束（部分导出文件的格式区域会延伸到上百万行）
+MAX_CONSECUTIVE_EMPTY_ROWS = 1000
+
+# 读取进度日志的打印间隔（行数）
+PROGRESS_LOG_ROWS = 1000
+
+# 售卖明细字段映射：(数据库字段, Excel列名, 转换方式)
+# 转换方式：str —— 非空转字符串否则为 None；float / datetime 见 _parse_float / _parse_datetime
+_OWNER_NICKNAME_COL = '订单归属人昵称(字段如果获取不到就默认展示商家，具体金额以账单为主)'
+SALES_FIELDS = (
+    ('order_id', '所属订单ID', 'str'),
+    ('sub_order_id', '子订单ID', 'str'),
+    ('coupon_status', '券码状态', 'str'),
+    ('verification_time', '核销时间', 'datetime'),
+    ('actual_receipt', '订单实收', 'float'),
+    ('sale_amount', '售卖金额', 'float'),
+    ('merchant_subsidy', '商家货款出资补贴', 'float'),
+    ('product_payment', '商品实付', 'float'),
+    ('platform_subsidy', '平台补贴', 'float'),
+    ('platform_discount_detail', '平台补贴优惠明细', 'str'),
+    ('software_fee', '软件服务费', 'float'),
+    ('talent_commission', '达人佣金', 'float'),
+    ('increment_commission', '增量宝佣金', 'float'),
+    ('preset_price', '预售价(只针对酒旅商家)', 'float'),
+    ('booking_surcharge', '预约加价(只针对酒旅商家)', 'float'),
+    ('software_fee_rate', '软件服务费率', 'str'),
+    ('sales_role', '带货角色', 'str'),
+    ('deal_channel', '成交渠道', 'str'),
+    ('owner_nickname', _OWNER_NICKNAME_COL, 'nickname'),
+    ('owner_uid', '订单归属人uid', 'str'),
+)
+
+# 售卖明细记录元组的列顺序：SALES_FIELDS 的字段 + 文件信息 + 原始数据，与 save_excel_orders 的 columns 对应
+SALES_COLS = tuple(key for key, _, _ in SALES_FIELDS) + ('file_name', 'import_time', 'raw_excel')
+
+
+# Excel 序列日期的纪元偏移：序列号 + 该值 = date.toordinal()（1899-12-30 为第 0 天）
+_EXCEL_EPOCH_ORD = date(1899, 12, 30).toordinal()
+
+# 日期字符串快速校验：YYYY-MM-DD / YYYY/MM/DD 开头（月、日可为一位）
+_DATE_PREFIX_RE = re.compile(r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}')
+
+# 日期格式表：(分隔符, 是否带时间) -> strptime 格式，每个字符串只尝试一种格式
+_DATE_FMTS = {
+    ('-', False): '%Y-%m-%d',
+    ('-', True): '%Y-%m-%d %H:%M:%S',
+    ('/', False): '%Y/%m/%d',
+    ('/', True): '%Y/%m/%d %H:%M:%S',
+}
+
+# Excel 文件名匹配：一次匹配同时完成扩展名校验和类型识别；前缀未知时分组为 None
+_FILE_RE = re.compile(r'^(?:(售卖明细|旅行社预约明细)_)?.*\.xlsx$')
+
+# 文件名前缀 -> Excel类型（'sales' 售卖明细 / 'travel' 旅行社预约明细）
+_FILE_KINDS = {
+    '售卖明细': 'sales',
+    '旅行社预约明细': 'travel',
+}
+
+
+# 已映射到售卖明细字段的列，raw_excel 默认不再重复保存
+_SALES_CAPTURED_COLUMNS = frozenset(header for _, header, _ in SALES_FIELDS)
+
+# 已映射到旅行社预约字段的列
+_TRAVEL_CAPTURED_COLUMNS = frozenset(('订单编号', '出行日期', '预约份数'))
+
+
+def _str_or_none(value):
+    """非空值转字符串，空值返回 None"""
+    return str(value) if value else None
+
+
+def _owner_nickname(value):
+    """订单归属人昵称，获取不到时默认展示“商家”"""
+    return str(value) if value else '商家'
+
+
+def _is_empty_row(row: tuple) -> bool:
+    """
+    判断是否为空行：所有单元格都是 None
+    
+    不能用 any(row)，否则 0 / 0.0 等有效数值会被误判为空
+    """
+    if not row:
+        return True
+    if row[0] is not None or row[-1] is not None:
+        return False
+    return all(v is None for v in row)
+
+
+def _reset_dimensions(ws):
+    """
+    忽略工作表声明的尺寸（openpyxl 只读模式）
+    
+    部分导出文件的 dimension 标记不准：偏小会导致只读模式漏读数据，
+    偏大（如 A1:BK1048501）会按声明的列数补齐每一行。重置后按实际内容读取
+    """
+    reset = getattr(ws, 'reset_dimensions', None)
+    if reset:
+        reset()
+
+
+def _fit_row(row: tuple, width: int) -> tuple:
+    """将一行单元格补齐/截断为表头宽度，之后可直接按列下标取值"""
+    if len(row) == width:
+        return row
+    return (row + (None,) * width)[:width]
+
+
+def _calamine_value(value):
+    """
+    把 calamine 的单元格值转换为 openpyxl 的表示
+    
+    calamine 用空字符串表示空单元格（openpyxl 为 None）；数字一律返回 float，
+    而 openpyxl 对整数值返回 int，否则数字型订单ID/SKU ID 会被转成 '123456.0'
+    """
+    if value == '':
+        return None
+    if type(value) is float and value.is_integer():
+        return int(value)
+    return value
+
+
+class _CalamineSheet:
+    """calamine 工作表的轻量包装，提供与 openpyxl 只读工作表相同的 title / max_row / iter_rows 接口"""
+    
+    def __init__(self, workbook, name: str):
+        self._workbook = workbook
+        self.title = name
+        self._sheet = workbook.get_sheet_by_name(name)
+    
+    @property
+    def max_row(self) -> int:
+        return self._sheet.height
+    
+    def iter_rows(self, values_only: bool = True):
+        """
+        [生成器] 逐行返回单元格值元组，取值与 openpyxl 只读模式保持一致
+        
+        使用 calamine 的行迭代器逐行转换为 Python 对象（不用 to_python 一次性构造整张表），
+        上游的分批解析和连续空行截断因此仍然有效
+        """
+        convert = _calamine_value
+        for row in self._sheet.iter_rows():
+            yield tuple(map(convert, row))
+
+
+class _CalamineWorkbookAdapter:
+    """calamine 工作簿的轻量包装，提供与 openpyxl 工作簿相同的 worksheets / active / close 接口"""
+    
+    def __init__(self, file_path: str):
+        self._workbook = CalamineWorkbook.from_path(file_path)
+        self.worksheets = [_CalamineSheet(self._workbook, name) for name in self._workbook.sheet_names]
+    
+    @property
+    def active(self):
+        return self.worksheets[0]
+    
+    def close(self):
+        close = getattr(self._workbook, 'close', None)
+        if close:
+            close()
+
+
+def _open_workbook(file_path: str):
+    """
+    打开Excel工作簿（只读）
+    
+    安装了 python-calamine 时使用 calamine，否则使用 openpyxl 只读 + 仅取值模式
+    
+    Args:
+        file_path: Excel文件路径
+        
+    Returns:
+        工作簿对象（支持 worksheets / active / close）
+    """
+    if CalamineWorkbook is not None:
+        return _CalamineWorkbookAdapter(file_path)
+    # read_only=True 流式解析 XML，不为每个单元格构造对象；data_only=True 直接取公式缓存值
+    return openpyxl.load_workbook(file_path, data_only=True, read_only=True)
+
 
 class ExcelImporter:
     """Excel数据导入器"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, keep_raw: bool = False, parse_workers: int = 1, check_lxml: bool = True):
         """
         初始化导入器
         
         Args:
             db_manager: 数据库管理器
+            keep_raw: raw_excel 是否保存整行原始数据（默认 False：只保存未映射到字段的列）
+            parse_workers: 并行解析Excel的进程数（默认 1：顺序导入，售卖明细边解析边写库）
+            check_lxml: 是否检查 lxml 并给出提示（解析子进程中关闭，避免每个文件重复告警）
         """
         self.db_manager = db_manager
+        self.keep_raw = keep_raw
+        self.parse_workers = parse_workers
+        
+        # openpyxl 安装了 lxml 时自动使用 C 实现的 XML 解析器，否则回退到标准库 ElementTree（慢数倍）
+        if check_lxml and CalamineWorkbook is None and not LXML:
+            logger.warning("未检测到 lxml，openpyxl 将使用标准库 XML 解析器，Excel 读取较慢（pip install lxml）")
     
-    def read_excel_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def _raw_extractor(self, headers: List[Any], captured_columns):
         """
-        读取Excel文件（单sheet）
+        生成 raw_excel 的提取函数
+        
+        默认只保留没有映射到数据库字段的列，避免同一份数据在字段和 JSONB 中各存一遍
         
         Args:
-            file_path: Excel文件路径
+            headers: 表头列表
+            captured_columns: 已映射到数据库字段的列名集合
             
         Returns:
-            Excel数据列表（每行一个字典）
+            函数：row -> dict（无剩余列时返回 None）
+        """
+        if self.keep_raw:
+            return lambda row: dict(zip(headers, row))
+        
+        extra = [(h, i) for i, h in enumerate(headers) if h not in captured_columns]
+        if not extra:
+            return lambda row: None
+        return lambda row: {h: row[i] for h, i in extra}
+    
+    def _iter_data_rows(self, rows_iter: Iterator[tuple], width: int) -> Iterator[tuple]:
+        """
+        [生成器] 从表头之后的行迭代器中取出有效数据行
+        
+        跳过空行，连续 MAX_CONSECUTIVE_EMPTY_ROWS 行为空时认为表格已结束
+        
+        Args:
+            rows_iter: 行迭代器（已取走表头）
+            width: 表头宽度
+            
+        Yields:
+            tuple: 与表头等宽的数据行
+        """
+        row_count = 0
+        empty_rows = 0
+        consecutive_empty = 0
+        next_log = PROGRESS_LOG_ROWS
+        for row in rows_iter:
+            # 检查空行
+            if _is_empty_row(row):
+                empty_rows += 1
+                consecutive_empty += 1
+                if consecutive_empty >= MAX_CONSECUTIVE_EMPTY_ROWS:
+                    logger.info(f"  连续 {consecutive_empty} 行为空，停止读取")
+                    break
+                continue
+            consecutive_empty = 0
+            
+            yield _fit_row(row, width)
+            row_count += 1
+            
+            # 每 PROGRESS_LOG_ROWS 行打印一次进度（只做一次比较，日志用 % 格式延迟格式化）
+            if row_count >= next_log:
+                logger.info("  已读取 %d 行...", row_count)
+                next_log += PROGRESS_LOG_ROWS
+        
+        logger.info(f"  读取完成: {row_count} 行有效数据 (跳过 {empty_rows} 行空数据)")
+    
+    def iter_excel_rows(self, file_path: str) -> Iterator[tuple]:
+        """
+        [生成器] 流式读取Excel文件（单sheet）
+        
+        第一个元素是表头元组，之后逐行交出与表头等宽的数据元组（空行已跳过），
+        不在内存中保留整张表
+        
+        Args:
+            file_path: Excel文件路径
+            
+        Yields:
+            tuple: 表头，随后为数据行
         """
+        wb = None
         try:
-            # 使用data_only=True模式，更稳定
-            wb = openpyxl.load_workbook(file_path, data_only=True)
+            wb = _open_workbook(file_path)
             ws = wb.active
             
             # 调试信息
             logger.info(f"  打开工作表: {ws.title}")
-            logger.info(f"  总行数: {ws.max_row}")
-            
-            # 获取表头（第一行）
-            headers = [cell.value for cell in ws[1]]
-            logger.info(f"  表头: {headers[:5]}...")  # 只打印前5个
-            
-            # 读取数据行
-            data = []
-            empty_rows = 0
-            for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                # 检查空行
-                if not any(row):
-                    empty_rows += 1
-                    continue
-                
-                row_dict = {}
-                for j, value in enumerate(row):
-                    if j < len(headers):
-                        row_dict[headers[j]] = value
-                data.append(row_dict)
-                
-                # 每1000行打印一次进度
-                if len(data) % 1000 == 0:
-                    logger.info(f"  已读取 {len(data)} 行...")
+            # 声明的行数常因格式区域虚高（上百万行）且并不参与读取，只在 DEBUG 级别打印；
+            # 实际行数由读取完成时的计数给出
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"  声明行数: {ws.max_row}")
+            _reset_dimensions(ws)
+            
+            # 获取表头（第一行）；只读模式不支持 ws[1] 随机访问，单次遍历迭代器
+            rows_iter = ws.iter_rows(values_only=True)
+            headers = tuple(next(rows_iter, ()))
+            logger.info(f"  表头: {list(headers[:5])}...")  # 只打印前5个
+            yield headers
             
-            logger.info(f"  读取完成: {len(data)} 行有效数据 (跳过 {empty_rows} 行空数据)")
-            wb.close()
-            return data
+            # 读取数据行：保留原始元组，不再为每行构造字典
+            yield from self._iter_data_rows(rows_iter, len(headers))
             
         except Exception as e:
             logger.error(f"读取Excel失败 {file_path}: {e}", exc_info=True)
             raise
+        finally:
+            # openpyxl 只读模式会一直持有底层 zip 文件句柄，必须显式关闭
+            if wb is not None:
+                wb.close()
     
-    def read_sheet(self, sheet) -> List[Dict[str, Any]]:
+    def read_excel_file(self, file_path: str) -> Tuple[List[Any], List[tuple]]:
+        """
+        读取Excel文件（单sheet）
+        
+        Args:
+            file_path: Excel文件路径
+            
+        Returns:
+            (表头列表, 数据行列表)：每行是与表头等宽的元组
+        """
+        rows_iter = self.iter_excel_rows(file_path)
+        headers = list(next(rows_iter))
+        return headers, list(rows_iter)
+    
+    def read_sheet(self, sheet) -> Tuple[List[Any], List[tuple]]:
         """
         读取单个工作表
         
         Args:
-            sheet: openpyxl工作表对象
+            sheet: 工作表对象（openpyxl 只读工作表或 calamine 包装）
             
         Returns:
-            数据列表
+            (表头列表, 数据行列表)：每行是与表头等宽的元组
         """
         try:
             # 调试信息
             logger.info(f"  打开工作表: {sheet.title}")
-            logger.info(f"  总行数: {sheet.max_row}")
-            
-            # 获取表头（第一行）
-            headers = [cell.value for cell in sheet[1]]
+            # 声明的行数常因格式区域虚高（上百万行）且并不参与读取，只在 DEBUG 级别打印；
+            # 实际行数由读取完成时的计数给出
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"  声明行数: {sheet.max_row}")
+            _reset_dimensions(sheet)
+            
+            # 获取表头（第一行）；只读模式不支持 sheet[1] 随机访问，单次遍历迭代器
+            rows_iter = sheet.iter_rows(values_only=True)
+            headers = list(next(rows_iter, ()))
             logger.info(f"  完整表头: {headers}")  # 打印完整表头
             
             # 检查是否有"出行日期"列
             if '出行日期' not in headers:
                 logger.warning(f"  ⚠️ 警告：表头中没有'出行日期'列！可用列: {headers}")
             
-            # 读取数据行
-            data = []
-            empty_rows = 0
-            for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                # 检查空行
-                if not any(row):
-                    empty_rows += 1
-                    continue
-                
-                row_dict = {}
-                for j, value in enumerate(row):
-                    if j < len(headers):
-                        row_dict[headers[j]] = value
-                data.append(row_dict)
-                
-                # 每1000行打印一次进度
-                if len(data) % 1000 == 0:
-                    logger.info(f"  已读取 {len(data)} 行...")
-            
-            logger.info(f"  读取完成: {len(data)} 行有效数据 (跳过 {empty_rows} 行空数据)")
-            return data
+            # 读取数据行：保留原始元组，不再为每行构造字典
+            data = list(self._iter_data_rows(rows_iter, len(headers)))
+            return headers, data
         except Exception as e:
             logger.error(f"读取工作表失败: {e}", exc_info=True)
-            return []
+            return [], []
     
-    def parse_sales_data(self, excel_data: List[Dict[str, Any]], file_name: str) -> List[Dict[str, Any]]:
+    def parse_sales_data(self, headers: List[Any], rows: List[tuple], file_name: str) -> List[tuple]:
         """
         解析售卖明细Excel数据
         
         Args:
-            excel_data: Excel原始数据
+            headers: 表头列表
+            rows: 数据行列表（与表头等宽的元组）
             file_name: 文件名
             
         Returns:
-            数据库格式的数据列表
+            数据库格式的记录元组列表（列顺序见 SALES_COLS）
         """
-        parsed_data = []
+        parsed_data = list(self.iter_sales_records(headers, rows, file_name))
+        logger.info(f"解析完成: {len(parsed_data)} 条记录")
+        return parsed_data
+    
+    def iter_sales_records(self, headers: List[Any], rows: Iterable[tuple], file_name: str) -> Iterator[tuple]:
+        """
+        [生成器] 逐条解析售卖明细数据
         
-        for row in excel_data:
-            # 构建数据库记录
-            record = {
-                'order_id': str(row.get('所属订单ID', '')) if row.get('所属订单ID') else None,
-                'sub_order_id': str(row.get('子订单ID', '')) if row.get('子订单ID') else None,
-                'coupon_status': str(row.get('券码状态', '')) if row.get('券码状态') else None,
-                'verification_time': self._parse_datetime(row.get('核销时间')),
-                'actual_receipt': self._parse_float(row.get('订单实收')),
-                'sale_amount': self._parse_float(row.get('售卖金额')),
-                'merchant_subsidy': self._parse_float(row.get('商家货款出资补贴')),
-                'product_payment': self._parse_float(row.get('商品实付')),
-                'platform_subsidy': self._parse_float(row.get('平台补贴')),
-                'platform_discount_detail': str(row.get('平台补贴优惠明细', '')) if row.get('平台补贴优惠明细') else None,
-                'software_fee': self._parse_float(row.get('软件服务费')),
-                'talent_commission': self._parse_float(row.get('达人佣金')),
-                'increment_commission': self._parse_float(row.get('增量宝佣金')),
-                'preset_price': self._parse_float(row.get('预售价(只针对酒旅商家)')),
-                'booking_surcharge': self._parse_float(row.get('预约加价(只针对酒旅商家)')),
-                'software_fee_rate': str(row.get('软件服务费率', '')) if row.get('软件服务费率') else None,
-                'sales_role': str(row.get('带货角色', '')) if row.get('带货角色') else None,
-                'deal_channel': str(row.get('成交渠道', '')) if row.get('成交渠道') else None,
-                'owner_nickname': str(row.get('订单归属人昵称(字段如果获取不到就默认展示商家，具体金额以账单为主)', '商家')) if row.get('订单归属人昵称(字段如果获取不到就默认展示商家，具体金额以账单为主)') else '商家',
-                'owner_uid': str(row.get('订单归属人uid', '')) if row.get('订单归属人uid') else None,
-                'raw_excel': row,  # 原始数据
-                'file_name': file_name,
-                'import_time': datetime.now()
-            }
+        列下标只在表头上计算一次，逐行按下标取值，不再按中文列名逐个查字典；
+        记录为按 SALES_COLS 排列的元组，不再为每行构造字典
+        
+        Args:
+            headers: 表头列表
+            rows: 数据行迭代器（与表头等宽的元组）
+            file_name: 文件名
             
-            parsed_data.append(record)
+        Yields:
+            tuple: 数据库格式的记录（列顺序见 SALES_COLS）
+        """
+        converters = {
+            'str': _str_or_none,
+            'nickname': _owner_nickname,
+            'float': self._parse_float,
+            'datetime': self._parse_datetime,
+        }
+        col_idx = {h: i for i, h in enumerate(headers)}
         
-        logger.info(f"解析完成: {len(parsed_data)} 条记录")
-        return parsed_data
+        # 按 SALES_FIELDS 顺序：(列下标, 转换函数)；表头中缺失的列下标为 None
+        fields = [(col_idx.get(header), converters[kind]) for _, header, kind in SALES_FIELDS]
+        
+        # 同一批次的记录共用一个导入时间
+        now = datetime.now()
+        raw_excel = self._raw_extractor(headers, _SALES_CAPTURED_COLUMNS)
+        
+        # 按列转换：每列是 map(转换函数, map(itemgetter(列下标), chunk)) 的惰性迭代器，
+        # 取值与转换都在 C 层循环中完成，再用 zip 把各列重新拼成一行。
+        # 每列都要遍历一遍数据行，流式输入时先按批取出，内存中只保留一批
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, EXCEL_BATCH_SIZE))
+            if not chunk:
+                break
+            
+            columns = [
+                map(convert, map(itemgetter(idx), chunk)) if idx is not None
+                else repeat(convert(None))  # 缺失的列只转换一次
+                for idx, convert in fields
+            ]
+            
+            for row, *values in zip(chunk, *columns):
+                # 构建数据库记录（原始数据保持字典，由数据库层序列化为 JSONB）
+                yield (*values, file_name, now, raw_excel(row))
     
-    def parse_travel_booking_data(self, excel_data: List[Dict[str, Any]], sheet_name: str) -> List[Dict[str, Any]]:
+    def parse_travel_booking_data(self, headers: List[Any], rows: List[tuple], sheet_name: str) -> List[Dict[str, Any]]:
         """
         解析旅行社预约明细数据
         
         Args:
-            excel_data: Excel原始数据
+            headers: 表头列表
+            rows: 数据行列表（与表头等宽的元组）
             sheet_name: 工作表名
             
         Returns:
@@ -180,22 +460,40 @@ class ExcelImporter:
         """
         parsed_data = []
         
+        col_idx = {h: i for i, h in enumerate(headers)}
+        idx_order_number = col_idx.get('订单编号')
+        idx_travel_date = col_idx.get('出行日期')
+        idx_booking_count = col_idx.get('预约份数')
+        
         # 打印前3条数据的原始值，用于调试
-        for i, row in enumerate(excel_data[:3]):
-            logger.info(f"  示例数据 {i+1}: 订单编号={row.get('订单编号')}, 出行日期={row.get('出行日期')}, 类型={type(row.get('出行日期'))}")
+        for i, row in enumerate(rows[:3]):
+            travel_date = row[idx_travel_date] if idx_travel_date is not None else None
+            order_number = row[idx_order_number] if idx_order_number is not None else None
+            logger.info(f"  示例数据 {i+1}: 订单编号={order_number}, 出行日期={travel_date}, 类型={type(travel_date)}")
         
-        for row in excel_data:
+        # 同一批次的记录共用一个导入时间；循环内用到的函数先绑定到局部变量
+        now = datetime.now()
+        parse_date = self._parse_date
+        parse_int = self._parse_int
+        raw_excel = self._raw_extractor(headers, _TRAVEL_CAPTURED_COLUMNS)
+        append = parsed_data.append
+        
+        # 预约状态只取决于工作表名，整张表只需解析一次
+        booking_status = self._parse_booking_status(sheet_name)
+        
+        for row in rows:
             # 构建数据库记录
             record = {
-                'order_number': str(row.get('订单编号', '')) if row.get('订单编号') else None,
-                'travel_date': self._parse_date(row.get('出行日期')),
-                'booking_status': self._parse_booking_status(sheet_name),
-                'booking_count': self._parse_int(row.get('预约份数', 1)),
-                'raw_excel': row,  # 原始数据
-                'import_time': datetime.now()
+                'order_number': _str_or_none(row[idx_order_number]) if idx_order_number is not None else None,
+                'travel_date': parse_date(row[idx_travel_date] if idx_travel_date is not None else None),
+                'booking_status': booking_status,
+                # 缺少"预约份数"列时默认 1 份
+                'booking_count': parse_int(row[idx_booking_count]) if idx_booking_count is not None else 1,
+                'raw_excel': raw_excel(row),  # 原始数据（JSONB 需要字典）
+                'import_time': now
             }
             
-            parsed_data.append(record)
+            append(record)
         
         logger.info(f"解析完成: {len(parsed_data)} 条记录 (sheet: {sheet_name})")
         return parsed_data
@@ -204,72 +502,65 @@ class ExcelImporter:
         """解析日期时间"""
         if value is None:
             return None
-        if isinstance(value, datetime):
+        
+        # 按类型直接分派：data_only 模式下最常见的是已解析好的 datetime
+        t = type(value)
+        if t is datetime:
             return value
+        if t is date:
+            return datetime(value.year, value.month, value.day)
+        
         # Excel日期是数字，需要转换
         try:
-            return datetime.fromordinal(int(value) + 693594)
-        except:
+            if t is int:
+                return datetime.fromordinal(value + _EXCEL_EPOCH_ORD)
+            if t is float:
+                # 整数部分是日期，小数部分是一天中的时间
+                days = int(value)
+                return datetime.fromordinal(days + _EXCEL_EPOCH_ORD) + timedelta(seconds=round((value - days) * 86400))
+            if t is str:
+                return datetime.fromordinal(int(value) + _EXCEL_EPOCH_ORD)
+        except (ValueError, OverflowError):
             return None
+        
+        # 其他类型（datetime 子类等）
+        if isinstance(value, datetime):
+            return value
+        return None
     
     def _parse_date(self, value) -> date:
         """解析日期（支持多种格式）"""
         if value is None:
-            logger.warning(f"  日期为None")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("  日期为None")
             return None
         
         # 已经是datetime或date对象
         if isinstance(value, datetime):
-            logger.info(f"  日期格式: datetime -> {value}")
             return value.date()
         if isinstance(value, date):
-            logger.info(f"  日期格式: date -> {value}")
             return value
         
-        # 字符串格式：尝试解析常见日期格式
+        # 字符串格式：按分隔符和是否带时间直接选定一种格式
         if isinstance(value, str):
             date_str = value.strip()
-            logger.info(f"  日期格式: string -> {date_str}")
             
             if not date_str:
-                logger.warning(f"  日期为空字符串")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("  日期为空字符串")
                 return None
             
-            # 格式1: YYYY-MM-DD
-            if '-' in date_str:
+            if _DATE_PREFIX_RE.match(date_str):
+                fmt = _DATE_FMTS[(date_str[4], ' ' in date_str)]
                 try:
-                    result = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    logger.info(f"  ✅ 解析成功 (YYYY-MM-DD): {result}")
-                    return result
-                except Exception as e:
-                    logger.warning(f"  ❌ 解析失败 (YYYY-MM-DD): {date_str}, 错误: {e}")
-                    try:
-                        result = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').date()
-                        logger.info(f"  ✅ 解析成功 (YYYY-MM-DD HH:MM:SS): {result}")
-                        return result
-                    except Exception as e2:
-                        logger.warning(f"  ❌ 解析失败 (YYYY-MM-DD HH:MM:SS): {date_str}, 错误: {e2}")
-            
-            # 格式2: YYYY/MM/DD
-            if '/' in date_str:
-                try:
-                    result = datetime.strptime(date_str, '%Y/%m/%d').date()
-                    logger.info(f"  ✅ 解析成功 (YYYY/MM/DD): {result}")
-                    return result
-                except Exception as e:
-                    logger.warning(f"  ❌ 解析失败 (YYYY/MM/DD): {date_str}, 错误: {e}")
-                    try:
-                        result = datetime.strptime(date_str, '%Y/%m/%d %H:%M:%S').date()
-                        logger.info(f"  ✅ 解析成功 (YYYY/MM/DD HH:MM:SS): {result}")
-                        return result
-                    except Exception as e2:
-                        logger.warning(f"  ❌ 解析失败 (YYYY/MM/DD HH:MM:SS): {date_str}, 错误: {e2}")
+                    return datetime.strptime(date_str, fmt).date()
+                except ValueError as e:
+                    logger.warning(f"  ❌ 无法解析日期: {date_str}, 错误: {e}")
+                    return None
         
         # Excel数字日期（Excel序列日期）
         try:
-            result = datetime.fromordinal(int(value) + 693594).date()
-            logger.info(f"  ✅ 日期格式: Excel数字 {value} -> {result}")
-            return result
+            return date.fromordinal(int(value) + _EXCEL_EPOCH_ORD)
         except Exception as e:
             logger.warning(f"  ❌ 无法解析日期: {value} (type: {type(value)}), 错误: {e}")
             return None
@@ -292,7 +583,9 @@ class ExcelImporter:
         except:
             return 0.0
     
-    def _parse_booking_status(self, sheet_name: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _parse_booking_status(sheet_name: str) -> str:
         """根据工作表名解析预约状态"""
         if '已预约' in sheet_name:
             return '已预约'
@@ -301,6 +594,31 @@ class ExcelImporter:
         else:
             return sheet_name  # 默认使用sheet名
     
+    def save_sales_records(self, records: Iterable[tuple], file_name: str) -> Tuple[int, int]:
+        """
+        分批保存售卖明细记录
+        
+        Args:
+            records: 记录元组迭代器（列顺序见 SALES_COLS，可为生成器，边解析边写库）
+            file_name: 文件名
+            
+        Returns:
+            (解析条数, 保存条数)
+        """
+        saved_count = 0
+        parsed_count = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= EXCEL_BATCH_SIZE:
+                saved_count += self.db_manager.save_excel_orders(batch, file_name, columns=SALES_COLS)
+                parsed_count += len(batch)
+                batch = []
+        if batch:
+            saved_count += self.db_manager.save_excel_orders(batch, file_name, columns=SALES_COLS)
+            parsed_count += len(batch)
+        return parsed_count, saved_count
+    
     def import_sales_excel(self, file_path: str, file_name: str) -> int:
         """
         导入售卖明细Excel
@@ -314,44 +632,43 @@ class ExcelImporter:
         """
         logger.info(f"开始导入售卖明细: {file_name}")
         
+        # 读取 → 解析 → 写库 全程流式，内存中最多只保留一批记录
+        rows_iter = self.iter_excel_rows(file_path)
         try:
-            # 读取Excel文件
-            excel_data = self.read_excel_file(file_path)
-            
-            # 解析数据
-            parsed_data = self.parse_sales_data(excel_data, file_name)
+            # 读取Excel文件（第一个元素是表头）
+            headers = list(next(rows_iter))
             
-            # 保存到数据库
-            saved_count = self.db_manager.save_excel_orders(parsed_data, file_name)
+            # 解析数据并分批保存到数据库
+            parsed_count, saved_count = self.save_sales_records(
+                self.iter_sales_records(headers, rows_iter, file_name), file_name
+            )
             
+            logger.info(f"解析完成: {parsed_count} 条记录")
             logger.info(f"✅ 售卖明细导入完成: {saved_count} 条记录")
             return saved_count
             
         except Exception as e:
             logger.error(f"导入售卖明细失败 {file_name}: {e}")
             raise
+        finally:
+            rows_iter.close()
     
-    def import_travel_booking_excel(self, file_path: str, file_name: str) -> int:
+    def collect_travel_bookings(self, file_path: str) -> List[Dict[str, Any]]:
         """
-        导入旅行社预约明细Excel
-        
-        收集所有sheet的数据后统一保存，避免分sheet删除导致数据丢失
+        读取并解析旅行社预约明细Excel的所有数据sheet
         
         Args:
             file_path: Excel文件路径
-            file_name: 文件名（仅用于日志）
             
         Returns:
-            int: 导入的记录数
+            所有sheet的数据库格式数据列表
         """
-        logger.info(f"开始导入旅行社预约明细: {file_name}")
-        
         # 收集所有sheet的数据
         all_booking_data = []
         
+        wb = None
         try:
-            # 使用data_only=True模式，更稳定
-            wb = openpyxl.load_workbook(file_path, data_only=True)
+            wb = _open_workbook(file_path)
             
             logger.info(f"  发现 {len(wb.worksheets)} 个工作表")
             
@@ -366,18 +683,39 @@ class ExcelImporter:
                     continue
                 
                 # 读取数据
-                excel_data = self.read_sheet(sheet)
+                headers, rows = self.read_sheet(sheet)
                 
                 # 解析数据
-                parsed_data = self.parse_travel_booking_data(excel_data, sheet_name)
+                parsed_data = self.parse_travel_booking_data(headers, rows, sheet_name)
                 
                 # 收集到总列表
                 all_booking_data.extend(parsed_data)
             
-            wb.close()
+            logger.info(f"  收集完成: 共 {len(all_booking_data)} 条记录")
+            return all_booking_data
+        finally:
+            if wb is not None:
+                wb.close()
+    
+    def import_travel_booking_excel(self, file_path: str, file_name: str) -> int:
+        """
+        导入旅行社预约明细Excel
+        
+        收集所有sheet的数据后统一保存，避免分sheet删除导致数据丢失
+        
+        Args:
+            file_path: Excel文件路径
+            file_name: 文件名（仅用于日志）
+            
+        Returns:
+            int: 导入的记录数
+        """
+        logger.info(f"开始导入旅行社预约明细: {file_name}")
+        
+        try:
+            all_booking_data = self.collect_travel_bookings(file_path)
             
             # 统一保存所有数据
-            logger.info(f"  收集完成: 共 {len(all_booking_data)} 条记录")
             saved_count = self.db_manager.save_travel_bookings(all_booking_data)
             
             logger.info(f"✅ 旅行社预约明细导入完成: {saved_count} 条记录")
@@ -387,14 +725,38 @@ class ExcelImporter:
             logger.error(f"导入旅行社预约明细失败 {file_name}: {e}", exc_info=True)
             raise
     
-    def scan_and_import(self, data_dir: str = 'data') -> int:
+    def _import_parsed(self, kind: str, records: List[Any], file_name: str) -> int:
+        """
+        保存子进程解析好的记录
+        
+        Args:
+            kind: Excel类型
+            records: 数据库格式的数据列表（售卖明细为 SALES_COLS 顺序的元组，旅行社预约为字典）
+            file_name: 文件名
+            
+        Returns:
+            int: 导入的记录数
+        """
+        if kind == 'sales':
+            _, saved_count = self.save_sales_records(records, file_name)
+            logger.info(f"✅ 售卖明细导入完成: {saved_count} 条记录 ({file_name})")
+        else:
+            saved_count = self.db_manager.save_travel_bookings(records)
+            logger.info(f"✅ 旅行社预约明细导入完成: {saved_count} 条记录 ({file_name})")
+        return saved_count
+    
+    def scan_and_import(self, data_dir: str = 'data', max_workers: Optional[int] = None) -> int:
         """
         扫描并导入所有Excel文件（支持两种类型）
         
+        默认顺序导入，售卖明细边解析边按 EXCEL_BATCH_SIZE 分批写库；
+        进程数大于 1 时使用进程池并行解析（XML 解析是 CPU 密集型），子进程整文件解析后
+        把结果交回主进程按扫描顺序依次写库，主进程中最多同时保留 max_workers + 1 个文件的解析结果；
         导入成功后删除Excel文件
         
         Args:
             data_dir: data文件夹路径
+            max_workers: 并行解析的进程数（默认取 parse_workers，1 为顺序导入）
             
         Returns:
             int: 导入的记录数
@@ -405,32 +767,103 @@ class ExcelImporter:
             logger.warning(f"目录不存在: {data_dir}")
             return 0
         
-        # 扫描所有.xlsx文件
-        for filename in os.listdir(data_dir):
-            if not filename.endswith('.xlsx'):
-                continue
-            
-            file_path = os.path.join(data_dir, filename)
-            
-            try:
-                # 判断Excel类型
-                if filename.startswith('售卖明细_'):
-                    # 类型1：售卖明细
-                    count = self.import_sales_excel(file_path, filename)
-                elif filename.startswith('旅行社预约明细_'):
-                    # 类型2：旅行社预约明细
-                    count = self.import_travel_booking_excel(file_path, filename)
-                else:
-                    logger.warning(f"未知的Excel类型: {filename}")
+        # 扫描所有.xlsx文件：scandir 的目录项自带文件类型，无需额外 stat
+        files = []
+        with os.scandir(data_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                
+                # 一次正则匹配完成扩展名校验和类型判断
+                match = _FILE_RE.match(entry.name)
+                if match is None:
                     continue
                 
-                total_imported += count
+                prefix = match.group(1)
+                if prefix is None:
+                    logger.warning(f"未知的Excel类型: {entry.name}")
+                    continue
                 
-                if count > 0:
-                    # 导入成功，删除文件
-                    os.remove(file_path)
-                    logger.info(f"✅ 已删除已导入文件: {filename}")
-            except Exception as e:
-                logger.error(f"导入文件失败 {filename}: {e}")
+                files.append((entry.path, entry.name, _FILE_KINDS[prefix]))
+        
+        if not files:
+            return 0
+        
+        if max_workers is None:
+            max_workers = self.parse_workers
+        
+        if max_workers <= 1 or len(files) == 1:
+            # 顺序导入：售卖明细边解析边写库
+            importers = {
+                'sales': self.import_sales_excel,             # 类型1：售卖明细
+                'travel': self.import_travel_booking_excel,   # 类型2：旅行社预约明细
+            }
+            for file_path, filename, kind in files:
+                try:
+                    count = importers[kind](file_path, filename)
+                    
+                    total_imported += count
+                    
+                    if count > 0:
+                        # 导入成功，删除文件
+                        os.remove(file_path)
+                        logger.info(f"✅ 已删除已导入文件: {filename}")
+                except Exception as e:
+                    logger.error(f"导入文件失败 {filename}: {e}")
+            
+            return total_imported
+        
+        # 并行解析：子进程只负责读取和解析（不持有数据库连接），主进程统一写库
+        logger.info(f"并行解析 {len(files)} 个Excel文件（{max_workers} 个进程）")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # 滑动窗口提交：取走一个结果才提交下一个文件，除正在写库的文件外最多 max_workers 个文件在解析中
+            pending = iter(files)
+            futures = deque()
+            
+            def submit_next():
+                for file_path, filename, kind in islice(pending, 1):
+                    future = pool.submit(_parse_excel_file, file_path, filename, kind, self.keep_raw)
+                    futures.append((future, file_path, filename, kind))
+            
+            for _ in range(max_workers):
+                submit_next()
+            
+            while futures:
+                future, file_path, filename, kind = futures.popleft()
+                submit_next()
+                try:
+                    records = future.result()
+                    count = self._import_parsed(kind, records, filename)
+                    
+                    total_imported += count
+                    
+                    if count > 0:
+                        # 导入成功，删除文件
+                        os.remove(file_path)
+                        logger.info(f"✅ 已删除已导入文件: {filename}")
+                except Exception as e:
+                    logger.error(f"导入文件失败 {filename}: {e}")
         
         return total_imported
+
+
+def _parse_excel_file(file_path: str, file_name: str, kind: str, keep_raw: bool = False) -> List[Any]:
+    """
+    在子进程中读取并解析一个Excel文件（不访问数据库，返回值可被 pickle）
+    
+    Args:
+        file_path: Excel文件路径
+        file_name: 文件名
+        kind: Excel类型（'sales' / 'travel'）
+        keep_raw: raw_excel 是否保存整行原始数据
+        
+    Returns:
+        数据库格式的数据列表（售卖明细为记录元组，旅行社预约为字典）
+    """
+    importer = ExcelImporter(None, keep_raw=keep_raw, check_lxml=False)
+    if kind == 'sales':
+        logger.info(f"开始解析售卖明细: {file_name}")
+        headers, rows = importer.read_excel_file(file_path)
+        return importer.parse_sales_data(headers, rows, file_name)
+    logger.info(f"开始解析旅行社预约明细: {file_name}")
+    return importer.collect_travel_bookings(file_path)
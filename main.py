@@ -5,16 +5,18 @@
 import signal
 import sys
 import time
+import threading
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from config import config
 from database import DatabaseManager
 from task_manager import TaskManager
-from douyin_api import DouyinAPI
+from douyin_api import DouyinAPI, DAY_SECONDS
 
 # 配置日志
+# 日志级别由 LOG_LEVEL 环境变量控制（默认 INFO，生产环境可设为 WARNING 减少输出）
 logging.basicConfig(
-    level=logging.INFO,
+    level=config.log_level,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -22,6 +24,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 处理的退出信号及其名称（预先计算，信号处理函数中只做字典查找）
+_SIG_NAMES = {int(s): s.name for s in (signal.SIGTERM, signal.SIGINT)}
+
+# 待机期间检查数据库停止指令的间隔（秒）；退出信号则通过事件立即唤醒
+STOP_POLL_INTERVAL = 10
+
 
 class DouyinOrderSync:
     """抖音订单同步主程序"""
@@ -34,7 +42,13 @@ class DouyinOrderSync:
             sys.exit(1)
         
         # 初始化数据库管理器（传入app_secret用于解密手机号）
-        self.db_manager = DatabaseManager(config.db_url, config.app_secret)
+        self.db_manager = DatabaseManager(
+            config.db_url,
+            config.app_secret,
+            application_name='douyin_sync',
+            statement_timeout=config.db_statement_timeout,
+            idle_in_transaction_timeout=config.db_idle_tx_timeout
+        )
         
         # 创建数据表（先创建表）
         self.db_manager.create_tables()
@@ -57,6 +71,13 @@ class DouyinOrderSync:
         # 运行标志
         self._running = False
         
+        # 退出事件：信号到达时立即唤醒等待中的主循环
+        self._stop_event = threading.Event()
+        
+        # 物化视图刷新状态：是否有未刷新的新数据、上次刷新时刻（monotonic）
+        self._views_dirty = False
+        self._last_refresh_ts = None
+        
         # 设置信号处理器
         self.setup_signal_handlers()
     
@@ -78,9 +99,9 @@ class DouyinOrderSync:
             signum: 信号编号
             frame: 当前栈帧
         """
-        signal_name = signal.Signals(signum).name
-        logger.info(f"收到信号 {signal_name} ({signum})，准备优雅退出...")
+        logger.info("收到信号 %s (%d)，准备优雅退出...", _SIG_NAMES.get(signum, signum), signum)
         self._running = False
+        self._stop_event.set()
     
     def run_once(self):
         """
@@ -102,21 +123,27 @@ class DouyinOrderSync:
                 logger.info("使用自定义时间范围配置")
             else:
                 # 使用天数计算时间范围
-                end_timestamp = int(datetime.now().timestamp())
-                start_timestamp = end_timestamp - (config.sync_days * 86400)  # 每天 86400 秒
-                logger.info(f"使用天数计算时间范围: 最近 {config.sync_days} 天")
+                # time.time() 直接得到 Unix 时间戳，不必先构造 datetime 再转换
+                end_timestamp = int(time.time())
+                start_timestamp = end_timestamp - config.sync_days * DAY_SECONDS
+                logger.info("使用天数计算时间范围: 最近 %d 天", config.sync_days)
             
             # 转换为 datetime 对象用于日志显示
             end_time = datetime.fromtimestamp(end_timestamp)
             start_time = datetime.fromtimestamp(start_timestamp)
             
-            logger.info(f"开始同步订单数据: {start_time} 到 {end_time}")
-            logger.info(f"时间戳范围: {start_timestamp} 到 {end_timestamp} (秒)")
+            logger.info("开始同步订单数据: %s 到 %s", start_time, end_time)
+            logger.info("时间戳范围: %d 到 %d (秒)", start_timestamp, end_timestamp)
             
             # 定义停止检查回调函数
             def check_stop():
                 return not self._running
             
+            # 增量同步：查询每天已入库的最大修改时间，拉取时跳过已同步的部分
+            watermarks = None
+            if config.incremental_sync:
+                watermarks = self.db_manager.get_update_watermarks(start_time, end_time)
+            
             # 拉取订单数据（使用配置参数，传递停止回调）
             orders = self.api.fetch_all_orders_by_day(
                 start_time=start_time,
@@ -125,58 +152,94 @@ class DouyinOrderSync:
                 order_status=config.order_status,
                 get_secret_number=config.get_secret_number,
                 use_create_time=config.use_create_time,
-                check_stop_callback=check_stop
+                check_stop_callback=check_stop,
+                max_workers=config.fetch_workers,
+                min_update_ts_per_day=watermarks
             )
             
             # 记录配置信息
-            logger.info(f"同步配置: 天数={config.sync_days}, 每页数量={config.page_size}, "
-                       f"订单状态={config.order_status or '全部'}, "
-                       f"查询配送={config.get_secret_number}, "
-                       f"使用创单时间={config.use_create_time}")
+            logger.info("同步配置: 天数=%s, 每页数量=%s, 订单状态=%s, 查询配送=%s, 使用创单时间=%s",
+                        config.sync_days, config.page_size, config.order_status or '全部',
+                        config.get_secret_number, config.use_create_time)
             
-            # 转换为 list（因为 orders 可能是 generator）
-            orders_list = list(orders) if not isinstance(orders, list) else orders
+            # 边拉取边写库：订单不在内存中整体缓存，拉取条数在写入过程中累计
+            # BULK_COPY 时通过 COPY 写入临时表再一次合并（单个事务）；
+            # 否则分批 Upsert，每批单独提交，拉取期间不持有事务和行锁
+            if config.bulk_copy:
+                fetched_count, saved_count = self.db_manager.save_orders_copy(orders)
+            else:
+                fetched_count, saved_count = self.db_manager.save_orders_iter(orders)
+            
+            # 订单全部写入后，用一个单独的小事务记录同步时间
+            if fetched_count:
+                self.task_manager.set_task_status('RUNNING', last_sync_time=end_time)
             
-            if not orders_list:
+            if not fetched_count:
                 logger.info("没有新的订单数据")
+                # 补做上一轮被推迟的视图刷新（没有待刷新数据时直接返回）
+                self.refresh_views()
                 return 0
             
-            # 保存订单到数据库
-            saved_count = self.db_manager.save_orders(orders_list)
+            logger.info("同步完成: 拉取 %d 条订单，保存 %d 条", fetched_count, saved_count)
             
-            # 更新任务状态
-            self.task_manager.set_task_status(
-                'RUNNING',
-                last_sync_time=end_time.isoformat()
-            )
-            
-            logger.info(f"同步完成: 拉取 {len(orders_list)} 条订单，保存 {saved_count} 条")
+            # 有新数据写入时才刷新依赖 orders 表的物化视图；刷新失败不影响本轮同步结果
+            if saved_count:
+                self._views_dirty = True
+            self.refresh_views()
             
             return saved_count
             
         except Exception as e:
-            logger.error(f"同步失败: {e}", exc_info=True)
+            logger.error("同步失败: %s", e, exc_info=True)
             
             # 更新任务状态为 ERROR
             self.task_manager.set_task_status('ERROR', error_message=str(e))
             
             raise
     
+    def refresh_views(self):
+        """
+        刷新物化视图（valid_orders 等）
+        
+        只在有未刷新的新数据时执行，且每个同步间隔内最多刷新一次（被推迟的刷新留到下一轮）；
+        刷新失败只记录日志，订单已经保存，下一轮同步会再次刷新
+        """
+        if not self._views_dirty:
+            return
+        
+        now = time.monotonic()
+        if self._last_refresh_ts is not None and now - self._last_refresh_ts < config.sync_interval:
+            logger.info("距上次刷新物化视图不足一个同步间隔，推迟到下一轮")
+            return
+        
+        try:
+            refreshed = self.db_manager.refresh_materialized_views()
+            self._views_dirty = False
+            self._last_refresh_ts = now
+            if refreshed:
+                logger.info("已刷新 %d 个物化视图", refreshed)
+        except Exception as e:
+            logger.error("刷新物化视图失败: %s", e, exc_info=True)
+    
     def smart_wait(self, seconds: int):
         """
         智能等待：支持中途被信号中断
         
-        每秒醒来检查一次退出信号和数据库指令
+        退出信号通过事件立即唤醒；数据库指令每 STOP_POLL_INTERVAL 秒检查一次
         
         Args:
             seconds: 等待的总秒数
         """
-        logger.info(f"进入待机模式，等待 {seconds} 秒...")
+        logger.info("进入待机模式，等待 %s 秒...", seconds)
         
-        step = 1  # 每次睡 1 秒
-        for _ in range(0, seconds, step):
-            # 【关键】每秒醒来检查一次：是否收到退出信号？
-            if not self._running:
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            # Event.wait 在等待期间不占用 CPU，收到退出信号时立即返回
+            if self._stop_event.wait(timeout=min(STOP_POLL_INTERVAL, remaining)):
                 logger.info("检测到退出信号，终止等待，准备关闭...")
                 return
             
@@ -184,8 +247,6 @@ class DouyinOrderSync:
             if self.task_manager.should_stop():
                 logger.info("检测到停止指令，终止等待...")
                 return
-            
-            time.sleep(step)
         
         logger.info("等待结束，准备进行下一轮同步")
     
@@ -200,11 +261,12 @@ class DouyinOrderSync:
         """
         logger.info("启动抖音订单同步程序")
         self._running = True
+        self._stop_event.clear()
         
         try:
             while self._running:
-                # 1. 检查控制指令
-                if self.task_manager.should_stop():
+                # 1. 更新心跳并检查控制指令（一次数据库往返）
+                if self.task_manager.tick() == 'STOP':
                     logger.info("收到停止指令，暂停同步")
                     self.task_manager.set_task_status('STOPPED')
                     self.smart_wait(10)  # 每 10 秒检查一次指令
@@ -212,26 +274,23 @@ class DouyinOrderSync:
                 
                 logger.info("开始新一轮同步")
                 
-                # 2. 更新心跳
-                self.task_manager.update_heartbeat()
-                
-                # 3. 拉取数据并存入数据库
+                # 2. 拉取数据并存入数据库
                 try:
                     self.run_once()
                 except Exception as e:
-                    logger.error(f"同步过程出错: {e}", exc_info=True)
+                    logger.error("同步过程出错: %s", e, exc_info=True)
                     # 出错后短时间等待
                     self.smart_wait(60)
                     continue
                 
-                # 4. 休息
+                # 3. 休息
                 wait_time = config.sync_interval
                 self.smart_wait(wait_time)
                         
         except KeyboardInterrupt:
             logger.info("接收到键盘中断")
         except Exception as e:
-            logger.error(f"主循环异常: {e}", exc_info=True)
+            logger.error("主循环异常: %s", e, exc_info=True)
         finally:
             self.stop()
     
@@ -248,7 +307,10 @@ class DouyinOrderSync:
             self.task_manager.set_task_status('STOPPED')
             logger.info("任务状态已更新为 STOPPED")
         except Exception as e:
-            logger.error(f"更新任务状态失败: {e}")
+            logger.error("更新任务状态失败: %s", e)
+        
+        # 关闭 API 客户端的 HTTP 连接
+        self.api.close()
         
         logger.info("程序已停止")
 
@@ -259,7 +321,7 @@ def main():
         sync = DouyinOrderSync()
         sync.run()
     except Exception as e:
-        logger.error(f"程序启动失败: {e}", exc_info=True)
+        logger.error("程序启动失败: %s", e, exc_info=True)
         sys.exit(1)
 
 
@@ -30,6 +30,15 @@ class TaskManager:
         """
         self.db_manager.update_heartbeat(self.task_id)
     
+    def tick(self) -> Optional[str]:
+        """
+        更新心跳并读取控制指令（一次数据库往返）
+        
+        Returns:
+            Optional[str]: 返回控制指令（如 'STOP', 'START'），如果没有指令则返回 None
+        """
+        return self.db_manager.heartbeat_and_get_command(self.task_id)
+    
     def get_control_command(self) -> Optional[str]:
         """
         获取后台控制指令
@@ -45,7 +54,7 @@ class TaskManager:
         """
         self.db_manager.clear_control_command(self.task_id)
     
-    def set_task_status(self, status: str, last_sync_time: str = None, 
+    def set_task_status(self, status: str, last_sync_time: datetime = None, 
                        error_message: str = None):
         """
         设置任务状态